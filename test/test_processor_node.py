@@ -16,7 +16,7 @@ import logging
 
 import numpy as np
 
-from apytypes import APyFixed, APyFixedArray
+from apytypes import APyFixedArray
 from apytypes import QuantizationMode
 from apytypes import OverflowMode
 
@@ -26,6 +26,11 @@ from cocotb.triggers import RisingEdge
 
 logger = logging.getLogger(__name__)
 
+# we follow the sfixed library convention
+# see IEEE 1076-2008 section G.4.4
+_QUANTIZATION = QuantizationMode.RND_CONV
+_OVERFLOW = OverflowMode.SAT
+
 
 class ProcessorNode:
     """
@@ -37,6 +42,27 @@ class ProcessorNode:
         self.dut = dut
         self.rng = np.random.default_rng()
 
+        # port handlers and fixed point sizes read from the dut
+        self._populate_cache()
+
+        # (uncasted, casted, port name) array triples queued by
+        # expected_output and checked by check_truncation
+        self._trunc_log_queue = []
+
+    def _populate_cache(self):
+        """
+            Read the port handlers and the fixed point sizes once,
+            every access to the dut goes through the simulator.
+        """
+        self._in_ports = tuple(self.data_in_ports())
+        self._in_i = tuple(self.data_in_int_bits())
+        self._in_f = tuple(self.data_in_frac_bits())
+        self._out_ports = tuple(self.data_out_ports())
+        self._cast_params = tuple(zip(
+            self.data_out_int_bits(),
+            self.data_out_frac_bits()
+        ))
+
     def data_in_ports(self):
         """
             Returns a list of handlers. Must be specialized in child classes.
@@ -91,79 +117,87 @@ class ProcessorNode:
         )
         return [None,]
 
-    def random_fixed_array(self, length, int_bits, frac_bits):
-        """
-            Generate a random fixed point number.
-        """
-        bits = int_bits + frac_bits
-        max_value = (2 ** (bits - 1) - 1) / 2 ** frac_bits
-        min_value = -(2 ** (bits - 1)) / 2 ** frac_bits
-        np_data = self.rng.uniform(
-            low=min_value,
-            high=max_value,
-            size=(length,)
-        )
-        ap_data = APyFixedArray.from_array(
-            np_data,
-            int_bits=int_bits,
-            frac_bits=frac_bits
-        )
-        return ap_data
-
     def random_data_in_arrays(self, length):
         """
             Generate a list of array of data for each in port.
         """
-        int_bits = self.data_in_int_bits()
-        frac_bits = self.data_in_frac_bits()
+        int_bits = self._in_i
+        frac_bits = self._in_f
+
+        # draw the samples of all the ports with a single
+        # rng call, one row per port, each row scaled
+        # to the range of its own fixed point format
+        scale = np.array([2.0 ** f for f in frac_bits])
+        top = np.array([float(1 << (i + f - 1))
+                        for (i, f) in zip(int_bits, frac_bits)])
+        max_value = (top - 1) / scale
+        min_value = -top / scale
+        np_data = self.rng.uniform(
+            low=min_value[:, np.newaxis],
+            high=max_value[:, np.newaxis],
+            size=(len(int_bits), length)
+        )
 
-        data_in = [self.random_fixed_array(length, i, f)
-                   for (i, f) in zip(int_bits, frac_bits)]
+        data_in = [
+            APyFixedArray.from_array(row, int_bits=i, frac_bits=f)
+            for (row, i, f) in zip(np_data, int_bits, frac_bits)
+        ]
         return data_in
 
-    def expected_output_uncasted(self, data_in):
+    def expected_output_uncasted_batch(self, data_in):
         """
-            The expected out value with full precision.
+            The expected out arrays with full precision, computed
+            elementwise over the in arrays of all the events.
             Must be specialized in child class.
         """
         logger.error(
             "The method is not overloaded by child class, test cannot work."
         )
-        return [APyFixed(data_in, 1, 1), ]
+        return [APyFixedArray([], 1, 1), ]
 
     def expected_output(self, data_in):
         """
-            The expected output with the given out precision.
+            The expected out arrays with the given out precision.
         """
-        int_bits = self.data_out_int_bits()
-        frac_bits = self.data_out_frac_bits()
-
-        data_out_uncasted = self.expected_output_uncasted(data_in)
+        data_out_uncasted = self.expected_output_uncasted_batch(data_in)
 
         data_out = [
             d.cast(
                 int_bits=i,
                 frac_bits=f,
-                # we follow the sfixed library convention
-                # see IEEE 1076-2008 section G.4.4
-                quantization=QuantizationMode.RND_CONV,
-                overflow=OverflowMode.SAT
-            ) for (d, i, f) in zip(data_out_uncasted, int_bits, frac_bits)
+                quantization=_QUANTIZATION,
+                overflow=_OVERFLOW
+            ) for (d, (i, f)) in zip(data_out_uncasted, self._cast_params)
         ]
 
         for du, dc, port in zip(
             data_out_uncasted,
             data_out,
-            self.data_out_ports()
+            self._out_ports
         ):
-            res = float(du - dc)
-            fu = float(du)
-            if abs(res) > 0.01 * abs(fu) and fu != 0:
-                pn = port._name  # pylint: disable=protected-access
+            pn = port._name  # pylint: disable=protected-access
+            self._trunc_log_queue.append((du, dc, pn))
+        return data_out
+
+    def check_truncation(self):
+        """
+            Warn for each out port where the casted expected output
+            differs more than 1% from the full precision one.
+        """
+        for du, dc, pn in self._trunc_log_queue:
+            # the difference is exact in fixed point,
+            # only the comparison is done in float
+            fu = du.to_numpy()
+            res = (du - dc).to_numpy()
+            # |res| > 1% |fu| compared squared, a zero fu
+            # casts to zero and is never flagged
+            mask = res * res > 1e-4 * fu * fu
+            if np.any(mask):
                 logger.warning(
-                    "Truncation difference exceeded 1%% for out port %s.", pn
+                    "Truncation difference exceeded 1%% for out port %s "
+                    "in %d events.", pn, np.count_nonzero(mask)
                 )
-        return data_out
+        self._trunc_log_queue = []
 
     async def test_processor_node(self, n_events):
         """
@@ -172,14 +206,30 @@ class ProcessorNode:
         # generate random input data
         data_in = self.random_data_in_arrays(n_events+3)
 
+        # precompute the expected outputs before the
+        # simulation starts, so that the python side
+        # does the minimum work between clock edges
+        expected_all = self.expected_output(
+            [d[:n_events] for d in data_in]
+        )
+
+        # bit patterns of in and expected out values,
+        # converted once and grouped by clock cycle
+        bits_in = list(zip(*(d.to_bits() for d in data_in)))
+        bits_expected = list(zip(*(e.to_bits() for e in expected_all)))
+
+        in_ports = self._in_ports
+        out_ports = self._out_ports
+
         # initialize the inputs
-        for port_in in self.data_in_ports():
+        for port_in in in_ports:
             port_in.value = 0
 
         # reset the node
         self.dut.rst.value = 1
 
-        # initialize the clock and enable computation
+        # initialize the clock and enable computation,
+        # with cocotb 2 start() schedules the clock task itself
         clk = Clock(self.dut.clk, 10, units="ns")
         clk.start()
 
@@ -187,12 +237,15 @@ class ProcessorNode:
         await RisingEdge(self.dut.clk)
         self.dut.rst.value = 0
 
-        for n, d_n in enumerate(zip(*data_in)):
+        # out values read at each cycle, checked after the simulation
+        bits_out = [None] * n_events
+
+        for n, d_n in enumerate(bits_in):
             await RisingEdge(self.dut.clk)
 
             # set data in
-            for d, p in zip(d_n, self.data_in_ports()):
-                p.value = d.to_bits()
+            for d, p in zip(d_n, in_ports):
+                p.value = d
 
             # we have 3 clk cycle latency for the output because:
             # at +1clk the input is set
@@ -201,9 +254,17 @@ class ProcessorNode:
             if n < 3:
                 continue
 
-            expect_out = self.expected_output([d[n - 3] for d in data_in])
-
-            for e, o in zip(expect_out, self.data_out_ports()):
-                assert o.value.to_unsigned() == e.to_bits()
+            bits_out[n - 3] = tuple(o.value.to_unsigned() for o in out_ports)
 
         clk.stop()
+
+        # warn before the comparison, the truncation warnings
+        # help to understand an eventual mismatch
+        self.check_truncation()
+
+        for n, (b_o, b_e) in enumerate(zip(bits_out, bits_expected)):
+            for o, e, port in zip(b_o, b_e, out_ports):
+                pn = port._name  # pylint: disable=protected-access
+                assert o == e, (
+                    f"Event {n}: out port {pn} is {o:#x}, expected {e:#x}."
+                )
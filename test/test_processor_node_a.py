@@ -74,7 +74,7 @@ class ProcessorNodeA(ProcessorNode):
             self.dut.N_DECIMAL_WIDTH.value,
         ]
 
-    def expected_output_uncasted(self, data_in):
+    def expected_output_uncasted_batch(self, data_in):
         a, b, c = data_in
         return [a, b, c + a * b]
 
@@ -94,10 +94,10 @@ output_int = range(2, 4)
 output_frac = range(2, 4)
 
 
-@pytest.mark.parametrize("in_i", input_int)
-@pytest.mark.parametrize("in_f", input_frac)
-@pytest.mark.parametrize("out_s_i", output_int)
-@pytest.mark.parametrize("out_s_f", output_frac)
+@pytest.mark.parametrize("in_i", input_int, ids=lambda v: f"ii{v}")
+@pytest.mark.parametrize("in_f", input_frac, ids=lambda v: f"if{v}")
+@pytest.mark.parametrize("out_s_i", output_int, ids=lambda v: f"osi{v}")
+@pytest.mark.parametrize("out_s_f", output_frac, ids=lambda v: f"osf{v}")
 def test_runner(in_i, in_f, out_s_i, out_s_f):
     """
         cocotb runner for different input/output sizes.